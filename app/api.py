@@ -1,72 +1,222 @@
 from __future__ import annotations
 
 import io
-from pathlib import Path
-from typing import Any, Dict
+import json
+import shutil
+import threading
+import time
+import uuid
+from typing import Any, Dict, Optional
 
 import numpy as np
-import pandas as pd
-from fastapi import FastAPI, UploadFile, File
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, UploadFile, File, Form
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 
-from app.pipeline.extract import extract_features_one
+from app import metrics
+from app.jobs import JobQueue
+from app.pipeline.extract import extract_features_bytes, extract_features_one
 from app.pipeline.regress import FEATURE_COLS, TARGET_COL  # X cols and y name
+from app.pipeline.store import FeatureStore, StoreGeneration
 
 
 app = FastAPI(title="Avatar Demo API", version="0.1.0")
 
+_store = FeatureStore("outputs/store")
 
-def _load_training_table() -> pd.DataFrame:
-    # 使用 pipeline 产物作为“训练数据”（demo用）
-    cleaned_path = Path("outputs/cleaned.csv")
-    if not cleaned_path.exists():
-        raise FileNotFoundError("outputs/cleaned.csv not found. Run pipeline first.")
-    return pd.read_csv(cleaned_path)
+# 批量打分队列：SQLite 持久化，服务重启后从未完成的样本继续
+_jobs: Optional[JobQueue] = None
 
 
-def _fit_demo_model(df: pd.DataFrame):
-    # 用 cleaned.csv 拟合一个 Ridge（与 pipeline 一致的 demo 思路）
+@app.on_event("startup")
+def _start_jobs():
+    global _jobs
+    _jobs = JobQueue(
+        db_path="outputs/jobs/jobs.sqlite3",
+        work_dir="outputs/jobs",
+        extract_fn=extract_features_one,
+        predict_fn=_job_predict,
+    )
+    _jobs.start()
+    metrics.JOB_QUEUE_DEPTH.set_function(_jobs.pending_count)
+
+
+@app.on_event("shutdown")
+def _stop_jobs():
+    if _jobs is not None:
+        _jobs.stop()
+
+
+# 纯 ASGI middleware：热路径上不引入 BaseHTTPMiddleware 的 task group，流式响应计到最后一个字节
+app.add_middleware(metrics.RequestMetricsMiddleware)
+
+
+def _load_training_table() -> StoreGeneration:
+    # 使用 pipeline 发布的 mmap feature store 作为“训练数据”（demo用）；
+    # 各 worker 共享同一份 page cache，pipeline 重新发布后自动切到新 generation
+    return _store.current()
+
+
+def _fit_demo_model(gen: StoreGeneration):
+    # 用 cleaned 特征拟合一个 Ridge（与 pipeline 一致的 demo 思路）
     from sklearn.linear_model import Ridge
 
-    X = df[FEATURE_COLS].to_numpy(dtype=float)
-    y = df[TARGET_COL].to_numpy(dtype=float)
+    X = gen.matrix(FEATURE_COLS)
+    y = np.asarray(gen.column(TARGET_COL), dtype=float)
 
     model = Ridge(alpha=1.0, random_state=42)
     model.fit(X, y)
     return model
 
 
+_model_lock = threading.Lock()
+_model: Dict[str, Any] = {"generation": None, "model": None}
+
+
+def _get_model():
+    # 每个 store generation 只拟合一次（/predict 与批量打分共用）；重新发布后下一次请求重新拟合
+    gen = _load_training_table()
+    with _model_lock:
+        if _model["generation"] != gen.generation:
+            _model["model"] = _fit_demo_model(gen)
+            _model["generation"] = gen.generation
+        return _model["model"]
+
+
+def _job_predict(feats: Dict) -> Dict:
+    model = _get_model()
+    x = np.array([[feats[c] for c in FEATURE_COLS]], dtype=float)
+    return {TARGET_COL: float(model.predict(x)[0])}
+
+
 @app.get("/health")
 def health():
     return {"status": "ok"}
 
 
-@app.post("/predict")
-async def predict(file: UploadFile = File(...)):
-    # 1) 读图到临时文件（extract_features_one 走 cv2.imread 路线最省事）
-    suffix = Path(file.filename).suffix.lower() if file.filename else ".png"
-    tmp_path = Path("outputs") / f"_upload{suffix}"
-    tmp_path.parent.mkdir(parents=True, exist_ok=True)
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type="text/plain; version=0.0.4")
 
-    content = await file.read()
-    tmp_path.write_bytes(content)
 
-    feats, err = extract_features_one(str(tmp_path))
+@app.post("/predict")
+def predict(file: UploadFile = File(...)):
+    # 普通 def：FaceMesh 推理（含等锁）放到线程池，不阻塞 event loop
+    # 1) 读上传内容到内存并直接解码：--workers N / 并发请求之间没有共享的临时文件
+    phase = metrics.PREDICT_PHASE_LATENCY
+    with phase.time("upload_read"):
+        content = file.file.read()
+
+    timings: Dict[str, float] = {}
+    feats, err = extract_features_bytes(content, timings=timings)
+    for name, sec in timings.items():
+        phase.observe(sec, name)
     if err is not None or feats is None:
+        metrics.PREDICT_ERRORS.inc(err or "feature_extraction_failed")
         return JSONResponse(
             status_code=400,
             content={"error": err or "feature_extraction_failed"},
         )
 
-    # 2) 载入训练表并拟合 demo 模型（最小实现：每次请求拟合一次；后面可优化成启动时加载）
-    df = _load_training_table()
-    model = _fit_demo_model(df)
+    # 2) 取当前 generation 的 demo 模型（只在 generation 变化后的第一次请求里拟合）
+    with phase.time("model_fit"):
+        model = _get_model()
 
-    x = np.array([[feats[c] for c in FEATURE_COLS]], dtype=float)
-    pred = float(model.predict(x)[0])
+    with phase.time("predict"):
+        x = np.array([[feats[c] for c in FEATURE_COLS]], dtype=float)
+        pred = float(model.predict(x)[0])
 
     return {
         "features": feats,
         "model": {"type": "ridge", "alpha": 1.0, "target": TARGET_COL, "features": FEATURE_COLS},
         "prediction": {TARGET_COL: pred},
     }
+
+
+@app.post("/similar")
+def similar(
+    file: Optional[UploadFile] = File(None),
+    sample_id: Optional[str] = Form(None),
+    k: int = Form(5),
+):
+    # 普通 def：解码 + FaceMesh（可能在等批量 worker 占着的锁）放到线程池，不阻塞 event loop
+    # 二选一：上传图片，或用语料里的 sample_id 查询
+    if (file is None) == (sample_id is None):
+        return JSONResponse(status_code=400, content={"error": "provide exactly one of file or sample_id"})
+    if k < 1:
+        return JSONResponse(status_code=400, content={"error": "k must be >= 1"})
+
+    # index 与 sample_ids 同属一个 store generation，一起切换
+    try:
+        gen = _load_training_table()
+        index = gen.similar()
+    except FileNotFoundError:
+        return JSONResponse(status_code=503, content={"error": "similar_index_not_found"})
+
+    if sample_id is not None:
+        pos = gen.position(sample_id)
+        if pos is None:
+            return JSONResponse(status_code=404, content={"error": "sample_id_not_found"})
+        neighbours = gen.neighbours(*index.query_position(pos, k=k))
+        return {"query": {"sample_id": sample_id}, "space": index.space, "neighbours": neighbours}
+
+    # 直接从内存解码：多个 worker / 并发请求之间没有共享的临时文件
+    feats, err = extract_features_bytes(file.file.read())
+    if err is not None or feats is None:
+        return JSONResponse(status_code=400, content={"error": err or "feature_extraction_failed"})
+    try:
+        neighbours = gen.neighbours(*index.query_features(feats, k=k))
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": "nan_features", "detail": str(e)})
+    return {"query": {"features": feats}, "space": index.space, "neighbours": neighbours}
+
+
+@app.post("/jobs")
+def create_job(
+    input_dir: Optional[str] = Form(None),
+    archive: Optional[UploadFile] = File(None),
+):
+    # 普通 def：FastAPI 放到线程池里跑，解压 / 扫目录 / 批量 insert 不阻塞 event loop
+    # 二选一：服务器本地目录，或上传 .zip（解压到 outputs/jobs/{id}/input）
+    if (input_dir is None) == (archive is None):
+        return JSONResponse(status_code=400, content={"error": "provide exactly one of input_dir or archive"})
+
+    job_id = uuid.uuid4().hex
+    if archive is not None:
+        tmp_path = _jobs.work_dir / job_id / "upload.zip"
+        tmp_path.parent.mkdir(parents=True, exist_ok=True)
+        # 流式落盘，不把整个压缩包读进内存
+        with open(tmp_path, "wb") as f:
+            shutil.copyfileobj(archive.file, f, length=1 << 20)
+        try:
+            # 失败时 unpack_archive 会删掉 outputs/jobs/{id}/（含 upload.zip）
+            input_dir = _jobs.unpack_archive(job_id, str(tmp_path))
+        except ValueError as e:
+            return JSONResponse(status_code=400, content={"error": "invalid_archive", "detail": str(e)})
+        except Exception:
+            return JSONResponse(status_code=400, content={"error": "invalid_archive"})
+        finally:
+            tmp_path.unlink(missing_ok=True)
+
+    try:
+        job = _jobs.submit(input_dir, job_id=job_id)
+    except FileNotFoundError:
+        return JSONResponse(status_code=400, content={"error": "input_dir_not_found_or_not_dir"})
+    return JSONResponse(status_code=202, content=job)
+
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    job = _jobs.get(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": "job_not_found"})
+    return job
+
+
+@app.get("/jobs/{job_id}/results")
+def get_job_results(job_id: str):
+    if _jobs.get(job_id) is None:
+        return JSONResponse(status_code=404, content={"error": "job_not_found"})
+
+    # NDJSON：已完成的样本按顺序逐行输出（features.csv 的列 + prediction）
+    lines = (json.dumps(row, ensure_ascii=False) + "\n" for row in _jobs.iter_results(job_id))
+    return StreamingResponse(lines, media_type="application/x-ndjson")
@@ -1,11 +1,15 @@
 from app.pipeline.io import read_samples, write_io_log
-from app.pipeline.extract import run_feature_extraction
+from app.pipeline.extract import extract_features_one, run_feature_extraction
+from app.pipeline.video import read_clips, run_video_extraction
 from app.pipeline.clean import run_cleaning
-from app.pipeline.pca import run_pca
+from app.pipeline.pca import pca_task
 from app.pipeline.regress import run_regression
 from app.pipeline.report import run_report
+from app.pipeline.scheduler import Task, run_tasks
+from app.pipeline.store import FeatureStore, publish_feature_store
 import os
 import argparse
+from functools import partial
 
 def build_parser() -> argparse.ArgumentParser:
     p = argparse.ArgumentParser(prog="app")
@@ -15,6 +19,19 @@ def build_parser() -> argparse.ArgumentParser:
     run.add_argument("--input", required=True, help="Input data directory, e.g. data/")
     run.add_argument("--out", required=True, help="Output directory, e.g. outputs/")
     run.add_argument("--config", default="configs/default.yaml", help="Config yaml path")
+    run.add_argument(
+        "--mode",
+        choices=["images", "video"],
+        default="images",
+        help="images: one PNG per sample; video: video files / frame directories, one row per frame",
+    )
+
+    sim = sub.add_parser("similar", help="Find the k nearest corpus faces")
+    q = sim.add_mutually_exclusive_group(required=True)
+    q.add_argument("--image", help="Query image path")
+    q.add_argument("--sample-id", help="Query by corpus sample_id")
+    sim.add_argument("--k", type=int, default=5, help="Number of neighbours")
+    sim.add_argument("--store", default="outputs/store", help="Feature store published by `run` (holds the index)")
 
     return p
 
@@ -26,42 +43,108 @@ def main():
         from app.config import load_config
         cfg = load_config(args.config)
 
-        # step2：IO
-        samples, meta = read_samples(args.input)
-        log_path = write_io_log(args.out, meta)
-        print(f"[io] samples_ok={len(samples)} skipped={meta['num_skipped']} log={log_path}")
-
-        # step3：features
-        feat_meta = run_feature_extraction(samples, args.out)
-        print(f"[features] ok={feat_meta['num_ok']} fail={feat_meta['num_fail']} -> {feat_meta['output']}")
-
-        # step4：cleaning
-        features_path = os.path.join(args.out, "features.csv")
-        iqr_k = float(cfg.get("cleaning", {}).get("iqr_k", 1.5))
-        clean_meta = run_cleaning(features_path, args.out, iqr_k=iqr_k)
-        print(f"[clean] n={clean_meta['n_cleaned']} -> {clean_meta['cleaned_csv']}")
-
-        # Step5: PCA
-        cleaned_path = os.path.join(args.out, "cleaned.csv")
         seed = int(cfg.get("seed", 42))
-        n_components = int(cfg.get("pca", {}).get("n_components", 2))
-        pca_meta = run_pca(cleaned_path, args.out, n_components=n_components, seed=seed)
-        print(f"[pca] n={pca_meta['n']} -> {pca_meta['output']}")
-
-        # Step6: Regression
-        cleaned_path = os.path.join(args.out, "cleaned.csv")
-        alpha = float(cfg.get("regression", {}).get("alpha", 1.0))
-        reg_meta = run_regression(cleaned_path, args.out, seed=seed, alpha=alpha)
-        print(f"[regress] n={reg_meta['n']} -> {reg_meta['output']}")
-
-        # Step7: Report
-        rep_meta = run_report(
-            out_dir=args.out,
-            input_dir=args.input,
-            n_samples=len(samples),
-            n_cleaned=clean_meta["n_cleaned"],
+        frame_stride = int(cfg.get("video", {}).get("frame_stride", 1))
+        if frame_stride < 1:
+            raise SystemExit(f"video.frame_stride must be >= 1, got {frame_stride}")
+
+        # 各 step 是一个 task；只依赖 cleaned.csv 的分析（PCA、回归）并行跑，report 等它们都完成
+        def _features(done):
+            if args.mode == "video":
+                # step2：IO（视频文件 / 帧目录）
+                clips, meta = read_clips(args.input)
+                log_path = write_io_log(args.out, meta)
+                print(f"[io] clips_ok={len(clips)} skipped={meta['num_skipped']} log={log_path}")
+
+                # step3：features（FaceMesh tracking 模式，逐帧）
+                feat_meta = run_video_extraction(clips, args.out, frame_stride=frame_stride)
+                print(
+                    f"[features] clips={feat_meta['num_clips']} frames ok={feat_meta['num_ok']} "
+                    f"fail={feat_meta['num_fail']} fps={feat_meta['frames_per_sec']} -> {feat_meta['output']}"
+                )
+            else:
+                # step2：IO
+                samples, meta = read_samples(args.input)
+                log_path = write_io_log(args.out, meta)
+                print(f"[io] samples_ok={len(samples)} skipped={meta['num_skipped']} log={log_path}")
+
+                # step3：features
+                pipeline_cfg = cfg.get("extract", {}).get("pipeline")
+                feat_meta = run_feature_extraction(samples, args.out, pipeline=pipeline_cfg)
+                print(f"[features] ok={feat_meta['num_ok']} fail={feat_meta['num_fail']} -> {feat_meta['output']}")
+                for name, st in feat_meta["pipeline"]["stages"].items():
+                    print(f"[features]   stage={name} workers={st['workers']} util={st['utilization']:.0%}")
+            return feat_meta
+
+        def _clean(done):
+            # step4：cleaning
+            features_path = os.path.join(args.out, "features.csv")
+            iqr_k = float(cfg.get("cleaning", {}).get("iqr_k", 1.5))
+            clean_meta = run_cleaning(features_path, args.out, iqr_k=iqr_k)
+            print(f"[clean] n={clean_meta['n_cleaned']} -> {clean_meta['cleaned_csv']}")
+            return clean_meta
+
+        def _regress(done):
+            # Step6: Regression
+            cleaned_path = os.path.join(args.out, "cleaned.csv")
+            alpha = float(cfg.get("regression", {}).get("alpha", 1.0))
+            reg_meta = run_regression(cleaned_path, args.out, seed=seed, alpha=alpha)
+            print(f"[regress] n={reg_meta['n']} -> {reg_meta['output']}")
+            return reg_meta
+
+        def _report(done):
+            # Step7: Report
+            rep_meta = run_report(
+                out_dir=args.out,
+                input_dir=args.input,
+                n_samples=done["features"]["num_samples"],
+                n_cleaned=done["clean"]["n_cleaned"],
+            )
+            print(f"[report] -> {rep_meta['output']}")
+            return rep_meta
+
+        def _store(done):
+            # Step6b: mmap feature store + nearest-neighbour index（API workers 共享，原子切换 generation）
+            cleaned_path = os.path.join(args.out, "cleaned.csv")
+            keep = int(cfg.get("store", {}).get("keep_generations", 2))
+            store_meta = publish_feature_store(
+                cleaned_path, args.out, keep=keep, similar=cfg.get("similar", {}), seed=seed
+            )
+            print(f"[store] n={store_meta['n']} generation={store_meta['generation']} -> {store_meta['output']}")
+            sim_meta = store_meta["similar"]
+            print(f"[similar] n={sim_meta['n']} space={sim_meta['space']} -> {sim_meta['output']}")
+            return store_meta
+
+        # 新的分析 step：加一个 deps=("clean",) 的 Task，并把名字加到 report 的 deps 里
+        sched_cfg = cfg.get("scheduler", {})
+        tasks = [
+            Task("features", _features),
+            Task("clean", _clean, deps=("features",)),
+            Task(
+                "pca",
+                partial(
+                    pca_task,
+                    os.path.join(args.out, "cleaned.csv"),
+                    args.out,
+                    int(cfg.get("pca", {}).get("n_components", 2)),
+                    seed,
+                ),
+                deps=("clean",),
+                in_process=bool(sched_cfg.get("pca_in_process", False)),
+            ),
+            Task("regress", _regress, deps=("clean",)),
+            Task("store", _store, deps=("clean",)),
+            Task("report", _report, deps=("features", "clean", "pca", "regress")),
+        ]
+        max_workers = int(sched_cfg.get("max_workers", 2))
+        metas, timing = run_tasks(tasks, max_workers=max_workers)
+        feat_meta = metas["features"]
+        clean_meta = metas["clean"]
+        n_samples = feat_meta["num_samples"]
+        print(
+            f"[timing] wall={timing['wall_sec']}s critical_path={' -> '.join(timing['critical_path'])} "
+            f"({timing['critical_path_sec']}s) overlap={timing['overlap_sec']}s"
         )
-        print(f"[report] -> {rep_meta['output']}")
 
         import json, time
         from pathlib import Path
@@ -70,26 +153,49 @@ def main():
             "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
             "config_path": args.config,
             "config": cfg,
+            "mode": args.mode,
             "counts": {
-                "samples_scanned": len(samples),
+                "samples_scanned": n_samples,
                 "cleaned": clean_meta["n_cleaned"],
             },
+            "extract_pipeline": feat_meta.get("pipeline"),
+            "timing": timing,
             "artifacts": {
                 "features_csv": str(Path(args.out) / "features.csv"),
                 "cleaned_csv": str(Path(args.out) / "cleaned.csv"),
                 "pca_png": str(Path(args.out) / "pca.png"),
+                "pca_coords_csv": str(Path(args.out) / "pca_coords.csv"),
                 "regression_summary": str(Path(args.out) / "regression_summary.txt"),
                 "report_md": str(Path(args.out) / "report.md"),
+                "similar_index": metas["store"]["similar"]["output"],
+                "feature_store": metas["store"]["output"],
             },
         }
+        if args.mode == "video":
+            meta["artifacts"]["clips_csv"] = feat_meta["clips_output"]
         Path(args.out).mkdir(parents=True, exist_ok=True)
         (Path(args.out) / "run_metadata.json").write_text(json.dumps(meta, ensure_ascii=False, indent=2),
                                                           encoding="utf-8")
         print(f"[meta] -> {Path(args.out) / 'run_metadata.json'}")
 
-
-
-
-
-
-
+    elif args.cmd == "similar":
+        import json
+
+        if args.k < 1:
+            raise SystemExit(f"--k must be >= 1, got {args.k}")
+        gen = FeatureStore(args.store).current()
+        index = gen.similar()
+        if args.sample_id is not None:
+            pos = gen.position(args.sample_id)
+            if pos is None:
+                raise SystemExit(f"unknown sample_id: {args.sample_id}")
+            neighbours = gen.neighbours(*index.query_position(pos, k=args.k))
+        else:
+            feats, err = extract_features_one(args.image)
+            if err is not None:
+                raise SystemExit(f"feature extraction failed: {err}")
+            try:
+                neighbours = gen.neighbours(*index.query_features(feats, k=args.k))
+            except ValueError as e:
+                raise SystemExit(f"cannot query neighbours: {e}")
+        print(json.dumps({"space": index.space, "neighbours": neighbours}, ensure_ascii=False, indent=2))
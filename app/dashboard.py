@@ -1,6 +1,8 @@
 import os
 import json
 import requests
+import altair as alt
+import numpy as np
 import pandas as pd
 import streamlit as st
 
@@ -11,42 +13,120 @@ API_URL = st.sidebar.text_input("API URL", value="http://127.0.0.1:8001")
 
 st.title("Avatar Feature → Impression (Demo) Dashboard")
 
+# ---------- Cached loaders ----------
+# key = (path, mtime)：文件没变就不重读；pipeline 重跑后 mtime 变化自动失效
+def _mtime(path: str) -> float:
+    return os.path.getmtime(path) if os.path.exists(path) else -1.0
+
+
+@st.cache_resource(show_spinner=False, max_entries=8)
+def load_csv(path: str, mtime: float) -> pd.DataFrame:
+    # cache_resource：大表在 rerun 之间共享同一个对象（不像 cache_data 每次反序列化一份），只读使用
+    return pd.read_csv(path)
+
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def load_text(path: str, mtime: float) -> str:
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def summarize(path: str, mtime: float) -> dict:
+    # 服务端聚合：只把汇总结果发给浏览器
+    df = load_csv(path, mtime)
+    out = {"rows": len(df), "cols": list(df.columns)}
+    num = df.select_dtypes("number")
+    out["describe"] = num.describe().T if len(num.columns) else None
+    if "status" in df.columns:
+        out["status"] = df["status"].value_counts().rename_axis("status").reset_index(name="n")
+    if "error" in df.columns:
+        err = df["error"].fillna("").astype(str)
+        out["error"] = err[err != ""].value_counts().rename_axis("error").reset_index(name="n")
+    return out
+
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def density_bins(path: str, mtime: float, bins: int) -> pd.DataFrame:
+    # PC1/PC2 二维直方图：百万行也只画 bins x bins 个格子
+    Z = load_csv(path, mtime)
+    H, xe, ye = np.histogram2d(Z["PC1"].to_numpy(), Z["PC2"].to_numpy(), bins=bins)
+    ix, iy = np.nonzero(H)
+    return pd.DataFrame(
+        {
+            "x0": xe[ix], "x1": xe[ix + 1],
+            "y0": ye[iy], "y1": ye[iy + 1],
+            "n": H[ix, iy].astype(int),
+        }
+    )
+
+
+def show_table(title: str, path: str, key: str, page_size: int):
+    st.subheader(title)
+    if not os.path.exists(path):
+        st.warning(f"{path} not found. Run pipeline first.")
+        return
+
+    mtime = _mtime(path)
+    summary = summarize(path, mtime)
+    st.write({"rows": summary["rows"], "cols": summary["cols"]})
+    if summary.get("status") is not None:
+        st.dataframe(summary["status"], hide_index=True)
+    if summary.get("error") is not None and len(summary["error"]):
+        st.dataframe(summary["error"], hide_index=True)
+    if summary["describe"] is not None:
+        st.dataframe(summary["describe"])
+
+    # 服务端分页：每次只发一页
+    n_pages = max(1, -(-summary["rows"] // page_size))
+    page = st.number_input("Page", min_value=1, max_value=n_pages, value=1, step=1, key=f"{key}_page")
+    start = (int(page) - 1) * page_size
+    st.caption(f"rows {start + 1}–{min(start + page_size, summary['rows'])} of {summary['rows']}")
+    st.dataframe(load_csv(path, mtime).iloc[start:start + page_size])
+
+
 # ---------- Data block ----------
 st.header("1) Data")
+page_size = st.sidebar.selectbox("Rows per page", [10, 50, 200, 1000], index=0)
 col1, col2 = st.columns(2)
 
 features_path = os.path.join(OUT_DIR, "features.csv")
 cleaned_path = os.path.join(OUT_DIR, "cleaned.csv")
 
 with col1:
-    st.subheader("features.csv")
-    if os.path.exists(features_path):
-        df_feat = pd.read_csv(features_path)
-        st.write({"rows": len(df_feat), "cols": list(df_feat.columns)})
-        st.dataframe(df_feat.head(10))
-    else:
-        st.warning("outputs/features.csv not found. Run pipeline first.")
+    show_table("features.csv", features_path, "features", page_size)
 
 with col2:
-    st.subheader("cleaned.csv")
-    if os.path.exists(cleaned_path):
-        df_clean = pd.read_csv(cleaned_path)
-        st.write({"rows": len(df_clean), "cols": list(df_clean.columns)})
-        st.dataframe(df_clean.head(10))
-    else:
-        st.warning("outputs/cleaned.csv not found. Run pipeline first.")
+    show_table("cleaned.csv", cleaned_path, "cleaned", page_size)
 
 # ---------- Model block ----------
 st.header("2) Model")
 reg_path = os.path.join(OUT_DIR, "regression_summary.txt")
 if os.path.exists(reg_path):
     st.subheader("Regression summary")
-    st.code(open(reg_path, "r", encoding="utf-8").read(), language="text")
+    st.code(load_text(reg_path, _mtime(reg_path)), language="text")
 else:
     st.warning("outputs/regression_summary.txt not found.")
 
+coords_path = os.path.join(OUT_DIR, "pca_coords.csv")
 pca_path = os.path.join(OUT_DIR, "pca.png")
-if os.path.exists(pca_path):
+if os.path.exists(coords_path):
+    st.subheader("PCA density (PC1 × PC2)")
+    bins = st.slider("Bins", min_value=10, max_value=200, value=60, step=10)
+    grid = density_bins(coords_path, _mtime(coords_path), bins)
+    chart = (
+        alt.Chart(grid)
+        .mark_rect()
+        .encode(
+            x=alt.X("x0:Q", title="PC1"), x2="x1:Q",
+            y=alt.Y("y0:Q", title="PC2"), y2="y1:Q",
+            color=alt.Color("n:Q", scale=alt.Scale(type="log"), title="count"),
+            tooltip=["n:Q"],
+        )
+        .interactive()
+    )
+    st.altair_chart(chart, use_container_width=True)
+elif os.path.exists(pca_path):
     st.subheader("PCA plot")
     st.image(pca_path, use_container_width=True)
 else:
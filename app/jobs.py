@@ -0,0 +1,405 @@
+from __future__ import annotations
+
+import json
+import logging
+import math
+import os
+import shutil
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+import zipfile
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from app.pipeline.io import read_samples
+
+
+log = logging.getLogger(__name__)
+
+FEATURE_COLS = ["fWHR", "EFR", "ESI", "Smile_Angle", "Mouth_Width"]
+
+ExtractFn = Callable[[str], Tuple[Optional[Dict], Optional[str]]]
+PredictFn = Callable[[Dict], Optional[Dict]]
+
+# job 状态: queued -> running -> done
+# item 状态: pending -> running(owner, lease_until) -> ok / fail
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id      TEXT PRIMARY KEY,
+    status      TEXT NOT NULL,
+    input_dir   TEXT NOT NULL,
+    created_at  REAL NOT NULL,
+    updated_at  REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS job_items (
+    job_id      TEXT NOT NULL,
+    idx         INTEGER NOT NULL,
+    sample_id   TEXT NOT NULL,
+    path        TEXT NOT NULL,
+    status      TEXT NOT NULL,
+    error       TEXT NOT NULL DEFAULT '',
+    features    TEXT,
+    prediction  TEXT,
+    owner       TEXT,
+    lease_until REAL,
+    PRIMARY KEY (job_id, idx)
+);
+CREATE INDEX IF NOT EXISTS job_items_status ON job_items (status, job_id, idx);
+"""
+
+# 旧库（没有 lease / prediction 列）就地补列
+_ITEM_COLUMNS = {"prediction": "TEXT", "owner": "TEXT", "lease_until": "REAL"}
+
+
+def _json_safe(feats: Dict) -> Dict:
+    # NaN 不是合法 JSON，NDJSON 输出里用 null 表示
+    return {k: (None if isinstance(v, float) and math.isnan(v) else v) for k, v in feats.items()}
+
+
+def _default_extract(path: str) -> Tuple[Optional[Dict], Optional[str]]:
+    # 延迟导入：mediapipe 只在真正打分时加载
+    from app.pipeline.extract import extract_features_one
+
+    return extract_features_one(path)
+
+
+class JobQueue:
+    """
+    SQLite-persisted batch scoring queue, safe to share between processes
+    (e.g. uvicorn --workers N).
+
+    Every sample of a job is one row in job_items. A worker claims a row inside
+    a BEGIN IMMEDIATE transaction and holds it under a lease (owner +
+    lease_until) that a heartbeat thread keeps renewing. Rows whose lease has
+    expired — their worker crashed or the server was killed — are claimed
+    again, so a restarted server resumes where it left off without touching
+    rows that a live worker is still processing.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        work_dir: str,
+        num_workers: int = 1,
+        poll_sec: float = 0.5,
+        lease_sec: float = 60.0,
+        max_unpacked_bytes: int = 4 << 30,
+        extract_fn: Optional[ExtractFn] = None,
+        predict_fn: Optional[PredictFn] = None,
+    ):
+        self.db_path = Path(db_path)
+        self.work_dir = Path(work_dir)
+        self.num_workers = num_workers
+        self.poll_sec = poll_sec
+        self.lease_sec = lease_sec
+        self.max_unpacked_bytes = max_unpacked_bytes
+        self.extract_fn = extract_fn or _default_extract
+        self.predict_fn = predict_fn
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._threads: List[threading.Thread] = []
+        # 打分失败只对每个 job 打一次 traceback（store 未发布时每个样本都会失败）
+        self._predict_failed: set = set()
+        self._predict_failed_lock = threading.Lock()
+
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.work_dir.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+            have = {r["name"] for r in conn.execute("PRAGMA table_info(job_items)")}
+            for col, typ in _ITEM_COLUMNS.items():
+                if col not in have:
+                    conn.execute(f"ALTER TABLE job_items ADD COLUMN {col} {typ}")
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # 每次操作一个短连接：事务结束即提交并关闭，worker 线程之间不共享连接
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @contextmanager
+    def _write_txn(self) -> Iterator[sqlite3.Connection]:
+        # BEGIN IMMEDIATE 先拿到库级写锁：跨进程的 claim 也是串行的
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+    # ---------- lifecycle ----------
+    def start(self) -> None:
+        self._stop.clear()
+        for i in range(self.num_workers):
+            t = threading.Thread(target=self._worker, name=f"job-worker-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        t = threading.Thread(target=self._heartbeat, name="job-heartbeat", daemon=True)
+        t.start()
+        self._threads.append(t)
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        self._wake.set()
+        for t in self._threads:
+            t.join(timeout=timeout)
+        self._threads = []
+
+    # ---------- submit ----------
+    def new_job_dir(self, job_id: str) -> Path:
+        d = self.work_dir / job_id / "input"
+        d.mkdir(parents=True, exist_ok=True)
+        return d
+
+    def unpack_archive(self, job_id: str, archive_path: str) -> str:
+        """
+        Extract an uploaded .zip into the job's input dir (flattened, PNG only).
+        Raises ValueError when two members share a file name (flattening would
+        silently drop one) or the extracted PNGs exceed max_unpacked_bytes;
+        the job dir is removed on any failure.
+        """
+        dst = self.new_job_dir(job_id)
+        try:
+            with zipfile.ZipFile(archive_path) as zf:
+                members = []
+                seen: Dict[str, str] = {}
+                for info in zf.infolist():
+                    name = Path(info.filename).name
+                    if info.is_dir() or not name.lower().endswith(".png"):
+                        continue
+                    if name in seen:
+                        raise ValueError(f"duplicate file name in archive: {seen[name]}, {info.filename}")
+                    seen[name] = info.filename
+                    members.append((info, name))
+
+                # 先看声明的大小，再按实际写入字节数计（file_size 可以伪造）
+                if sum(info.file_size for info, _ in members) > self.max_unpacked_bytes:
+                    raise ValueError(f"archive expands beyond {self.max_unpacked_bytes} bytes")
+                total = 0
+                for info, name in members:
+                    with zf.open(info) as src, open(dst / name, "wb") as f:
+                        while True:
+                            chunk = src.read(1 << 20)
+                            if not chunk:
+                                break
+                            total += len(chunk)
+                            if total > self.max_unpacked_bytes:
+                                raise ValueError(f"archive expands beyond {self.max_unpacked_bytes} bytes")
+                            f.write(chunk)
+        except BaseException:
+            shutil.rmtree(self.work_dir / job_id, ignore_errors=True)
+            raise
+        return str(dst)
+
+    def submit(self, input_dir: str, job_id: Optional[str] = None) -> Dict:
+        job_id = job_id or uuid.uuid4().hex
+        samples, meta = read_samples(input_dir)
+        if any(sk["reason"] == "input_dir_not_found_or_not_dir" for sk in meta["skipped"]):
+            raise FileNotFoundError(f"input_dir not found or not dir: {input_dir}")
+
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (job_id, status, input_dir, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (job_id, "queued" if samples else "done", str(input_dir), now, now),
+            )
+            conn.executemany(
+                "INSERT INTO job_items (job_id, idx, sample_id, path, status) VALUES (?, ?, ?, ?, 'pending')",
+                [(job_id, i, s.sample_id, s.path) for i, s in enumerate(samples)],
+            )
+        self._wake.set()
+        return self.get(job_id)
+
+    # ---------- query ----------
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self._connect() as conn:
+            job = conn.execute("SELECT * FROM jobs WHERE job_id=?", (job_id,)).fetchone()
+            if job is None:
+                return None
+            counts = {
+                r["status"]: r["n"]
+                for r in conn.execute(
+                    "SELECT status, COUNT(*) AS n FROM job_items WHERE job_id=? GROUP BY status",
+                    (job_id,),
+                )
+            }
+
+        total = sum(counts.values())
+        done = counts.get("ok", 0) + counts.get("fail", 0)
+        return {
+            "job_id": job["job_id"],
+            "status": job["status"],
+            "input_dir": job["input_dir"],
+            "created_at": job["created_at"],
+            "updated_at": job["updated_at"],
+            "num_samples": total,
+            "num_done": done,
+            "num_ok": counts.get("ok", 0),
+            "num_fail": counts.get("fail", 0),
+            "progress": (done / total) if total else 1.0,
+        }
+
+    def pending_count(self) -> int:
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM job_items WHERE status='pending'").fetchone()[0]
+
+    def iter_results(self, job_id: str, batch_size: int = 1000) -> Iterator[Dict]:
+        """
+        Yield finished rows in sample order: the features.csv columns (null
+        features for failed samples) plus the /predict-style `prediction`.
+        """
+        last_idx = -1
+        while True:
+            with self._connect() as conn:
+                rows = conn.execute(
+                    "SELECT idx, sample_id, path, status, error, features, prediction FROM job_items "
+                    "WHERE job_id=? AND idx>? AND status IN ('ok', 'fail') ORDER BY idx LIMIT ?",
+                    (job_id, last_idx, batch_size),
+                ).fetchall()
+            if not rows:
+                return
+            for r in rows:
+                row = {"sample_id": r["sample_id"], "path": r["path"], "status": r["status"], "error": r["error"]}
+                feats = json.loads(r["features"]) if r["features"] else {}
+                row.update({c: feats.get(c) for c in FEATURE_COLS})
+                row["prediction"] = json.loads(r["prediction"]) if r["prediction"] else None
+                yield row
+            last_idx = rows[-1]["idx"]
+
+    # ---------- worker ----------
+    def _claim(self) -> Optional[sqlite3.Row]:
+        now = time.time()
+        with self._write_txn() as conn:
+            # FIFO by job, then by sample order inside the job;
+            # pending 优先，其次是 lease 已过期的 running（原 worker 已死）
+            item = None
+            for job in conn.execute(
+                "SELECT job_id FROM jobs WHERE status IN ('queued', 'running') ORDER BY created_at"
+            ).fetchall():
+                item = conn.execute(
+                    "SELECT job_id, idx, path FROM job_items WHERE status='pending' AND job_id=? ORDER BY idx LIMIT 1",
+                    (job["job_id"],),
+                ).fetchone() or conn.execute(
+                    "SELECT job_id, idx, path FROM job_items "
+                    "WHERE status='running' AND job_id=? AND lease_until<? ORDER BY idx LIMIT 1",
+                    (job["job_id"], now),
+                ).fetchone()
+                if item is not None:
+                    break
+            if item is None:
+                return None
+
+            cur = conn.execute(
+                "UPDATE job_items SET status='running', owner=?, lease_until=? "
+                "WHERE job_id=? AND idx=? AND (status='pending' OR (status='running' AND lease_until<?))",
+                (self.worker_id, now + self.lease_sec, item["job_id"], item["idx"], now),
+            )
+            if cur.rowcount != 1:
+                return None
+            conn.execute(
+                "UPDATE jobs SET status='running', updated_at=? WHERE job_id=? AND status='queued'",
+                (now, item["job_id"]),
+            )
+            return item
+
+    def _finish(
+        self,
+        job_id: str,
+        idx: int,
+        feats: Optional[Dict],
+        err: Optional[str],
+        prediction: Optional[Dict] = None,
+    ) -> None:
+        now = time.time()
+        with self._write_txn() as conn:
+            cur = conn.execute(
+                "UPDATE job_items SET status=?, error=?, features=?, prediction=?, owner=NULL, lease_until=NULL "
+                "WHERE job_id=? AND idx=? AND status='running' AND owner=?",
+                (
+                    "ok" if err is None else "fail",
+                    "" if err is None else err,
+                    json.dumps(_json_safe(feats)) if feats is not None else None,
+                    json.dumps(prediction) if prediction is not None else None,
+                    job_id,
+                    idx,
+                    self.worker_id,
+                ),
+            )
+            if cur.rowcount != 1:
+                # lease 已过期并被其他 worker 接手：结果以对方为准
+                log.warning("job %s item %s: lease lost, dropping result", job_id, idx)
+                return
+            left = conn.execute(
+                "SELECT 1 FROM job_items WHERE job_id=? AND status IN ('pending', 'running') LIMIT 1",
+                (job_id,),
+            ).fetchone()
+            status = "running" if left is not None else "done"
+            conn.execute("UPDATE jobs SET status=?, updated_at=? WHERE job_id=?", (status, now, job_id))
+
+    def _score(self, job_id: str, path: str) -> Tuple[Optional[Dict], Optional[str], Optional[Dict]]:
+        try:
+            feats, err = self.extract_fn(path)
+        except Exception as e:
+            return None, f"exception:{type(e).__name__}", None
+
+        prediction = None
+        if feats is not None and self.predict_fn is not None:
+            try:
+                prediction = self.predict_fn(feats)
+            except Exception:
+                with self._predict_failed_lock:
+                    first = job_id not in self._predict_failed
+                    self._predict_failed.add(job_id)
+                if first:
+                    log.exception("job %s: prediction failed for %s (further failures of this job are not logged)",
+                                  job_id, path)
+        return feats, err, prediction
+
+    def _worker(self) -> None:
+        backoff = self.poll_sec
+        while not self._stop.is_set():
+            try:
+                item = self._claim()
+                if item is None:
+                    self._wake.wait(self.poll_sec)
+                    self._wake.clear()
+                    continue
+
+                feats, err, prediction = self._score(item["job_id"], item["path"])
+                self._finish(item["job_id"], item["idx"], feats, err, prediction)
+                backoff = self.poll_sec
+            except Exception:
+                # 例如 "database is locked"：记日志、退避后继续，线程不能死
+                log.exception("job worker %s: iteration failed, retrying in %.1fs", self.worker_id, backoff)
+                self._stop.wait(backoff)
+                backoff = min(backoff * 2, 30.0)
+
+    def _heartbeat(self) -> None:
+        while not self._stop.wait(self.lease_sec / 3):
+            try:
+                with self._connect() as conn:
+                    conn.execute(
+                        "UPDATE job_items SET lease_until=? WHERE owner=? AND status='running'",
+                        (time.time() + self.lease_sec, self.worker_id),
+                    )
+            except Exception:
+                log.exception("job heartbeat %s failed", self.worker_id)
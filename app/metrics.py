@@ -0,0 +1,219 @@
+from __future__ import annotations
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+
+# 极简 Prometheus text exposition（不引入 prometheus_client 依赖）。
+# 热路径只做：一次 dict 查找 + 一次 bisect + 加锁累加。
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+LabelKey = Tuple[str, ...]
+
+
+def _escape(v: str) -> str:
+    # exposition format: label 值里的 \ " 换行 需要转义
+    return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _fmt_labels(names: Tuple[str, ...], values: LabelKey, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _fmt_value(v: float) -> str:
+    if v != v:
+        return "NaN"
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if not float(v).is_integer() else str(int(v))
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values: Dict[LabelKey, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, v in items:
+            lines.append(f"{self.name}{_fmt_labels(self.labelnames, labels)} {_fmt_value(v)}")
+        return lines
+
+
+class Gauge:
+    """Gauge set directly (inc/dec) or computed at scrape time via set_function()."""
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._value = 0.0
+        self._fn: Optional[Callable[[], float]] = None
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self._value -= amount
+
+    def set_function(self, fn: Optional[Callable[[], float]]) -> None:
+        self._fn = fn
+
+    def render(self) -> List[str]:
+        if self._fn is not None:
+            try:
+                v = float(self._fn())
+            except Exception:
+                v = float("nan")
+        else:
+            v = self._value
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge", f"{self.name} {_fmt_value(v)}"]
+
+
+class Histogram:
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(buckets))
+        # per label set: [bucket counts (non-cumulative, +Inf last), sum, count]
+        self._series: Dict[LabelKey, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str) -> None:
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            s = self._series.get(labels)
+            if s is None:
+                s = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            s[0][i] += 1
+            s[1] += value
+            s[2] += 1
+
+    @contextmanager
+    def time(self, *labels: str) -> Iterator[None]:
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0, *labels)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((k, (list(v[0]), v[1], v[2])) for k, v in self._series.items())
+        for labels, (counts, total, n) in items:
+            acc = 0
+            for le, c in zip(self.buckets + (float("inf"),), counts):
+                acc += c
+                le_label = f'le="{_fmt_value(le)}"'
+                lines.append(f"{self.name}_bucket{_fmt_labels(self.labelnames, labels, le_label)} {acc}")
+            lines.append(f"{self.name}_sum{_fmt_labels(self.labelnames, labels)} {total}")
+            lines.append(f"{self.name}_count{_fmt_labels(self.labelnames, labels)} {n}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: list = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for m in self._metrics:
+            lines.extend(m.render())
+        return "\n".join(lines) + "\n"
+
+
+# ---- API metrics (module-level singletons, per process) ----
+REGISTRY = Registry()
+
+REQUESTS = REGISTRY.register(
+    Counter("avatar_http_requests_total", "HTTP requests by route and status code.", ("method", "route", "status"))
+)
+REQUEST_LATENCY = REGISTRY.register(
+    Histogram("avatar_http_request_duration_seconds", "HTTP request latency by route.", ("method", "route"))
+)
+PREDICT_ERRORS = REGISTRY.register(
+    Counter("avatar_predict_errors_total", "Failed /predict requests by error reason.", ("reason",))
+)
+PREDICT_PHASE_LATENCY = REGISTRY.register(
+    Histogram("avatar_predict_phase_duration_seconds", "/predict latency split by phase.", ("phase",))
+)
+IN_FLIGHT = REGISTRY.register(Gauge("avatar_http_requests_in_flight", "HTTP requests currently being served."))
+JOB_QUEUE_DEPTH = REGISTRY.register(Gauge("avatar_job_queue_depth", "Job samples waiting to be scored."))
+
+
+class RequestMetricsMiddleware:
+    """
+    Plain ASGI middleware (no BaseHTTPMiddleware task group / memory stream).
+    Latency is observed when the last body message has been sent, so
+    streamed responses (/jobs/{id}/results) are timed to the end, not to
+    the headers.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        IN_FLIGHT.inc()
+        t0 = time.perf_counter()
+        status = 500
+        done = False
+
+        def _observe() -> None:
+            nonlocal done
+            if done:
+                return
+            done = True
+            IN_FLIGHT.dec()
+            # 用路由模板（/jobs/{job_id}）而不是实际路径做 label，避免高基数；
+            # router 匹配后把 route 写回同一个 scope
+            route_path = getattr(scope.get("route"), "path", "<unmatched>")
+            REQUEST_LATENCY.observe(time.perf_counter() - t0, scope["method"], route_path)
+            REQUESTS.inc(scope["method"], route_path, str(status))
+
+        async def _send(message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                _observe()
+
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            # 异常 / 客户端断开：没发出最后一个 body 也要记一次
+            _observe()
@@ -2,6 +2,8 @@ from __future__ import annotations
 
 from dataclasses import asdict
 from pathlib import Path
+import threading
+import time
 from typing import Dict, List, Optional, Tuple
 
 import cv2
@@ -10,11 +12,23 @@ import numpy as np
 import pandas as pd
 
 from .io import Sample
+from .stages import Stage, run_stages
 
 
 # ---- Mediapipe init (module-level singleton) ----
 _mp_face_mesh = mp.solutions.face_mesh
 _face_mesh = _mp_face_mesh.FaceMesh(static_image_mode=True)
+# FaceMesh graph 不是线程安全的；API 后台 worker 等多线程调用时串行化
+_face_mesh_lock = threading.Lock()
+
+# 默认 stage 配置（configs/default.yaml 的 extract.pipeline 可覆盖）
+# facemesh 共用一个模块级 graph（有锁），多开 worker 没有意义
+DEFAULT_PIPELINE = {
+    "read": {"workers": 4, "queue_depth": 64},
+    "decode": {"workers": 2, "queue_depth": 16},
+    "facemesh": {"workers": 1, "queue_depth": 16},
+    "geometry": {"workers": 1, "queue_depth": 64},
+}
 
 
 def _polygon_area(pts: np.ndarray) -> float:
@@ -30,26 +44,48 @@ def _fit_ellipse_ratio(eye_pts: np.ndarray) -> float:
     return (MA / ma) if ma > 0 else float("nan")
 
 
-def extract_features_one(image_path: str) -> Tuple[Optional[Dict], Optional[str]]:
-    """
-    Returns:
-      - features dict if success else None
-      - error_reason if failed else None
-    """
-    img = cv2.imread(image_path)
+def _read_bytes(path: str) -> Tuple[Optional[bytes], Optional[str]]:
+    try:
+        return Path(path).read_bytes(), None
+    except OSError:
+        return None, "cv2_imread_failed"
+
+
+def _decode_rgb(data: bytes) -> Tuple[Optional[np.ndarray], Optional[str]]:
+    # 与 cv2.imread(path) 等价：IMREAD_COLOR -> BGR，再转 RGB
+    img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
     if img is None:
         return None, "cv2_imread_failed"
+    return cv2.cvtColor(img, cv2.COLOR_BGR2RGB), None
 
-    h, w = img.shape[:2]
-    rgb_img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-    results = _face_mesh.process(rgb_img)
 
+def _landmark_points(results, w: int, h: int) -> Tuple[Optional[np.ndarray], Optional[str]]:
     if not results.multi_face_landmarks:
         return None, "no_face_detected"
 
     landmarks = results.multi_face_landmarks[0].landmark
     points = np.array([[lm.x * w, lm.y * h] for lm in landmarks], dtype=np.float32)
+    return points, None
+
+
+def _mesh_points(
+    rgb_img: np.ndarray,
+    timings: Optional[Dict[str, float]] = None,
+) -> Tuple[Optional[np.ndarray], Optional[str]]:
+    h, w = rgb_img.shape[:2]
+    t0 = time.perf_counter()
+    with _face_mesh_lock:
+        t1 = time.perf_counter()
+        results = _face_mesh.process(rgb_img)
+        t2 = time.perf_counter()
+    if timings is not None:
+        # 等锁（其他线程占着 FaceMesh）和真正推理分开记
+        timings["facemesh_lock_wait"] = t1 - t0
+        timings["facemesh"] = t2 - t1
+    return _landmark_points(results, w, h)
+
 
+def _geometry_features(points: np.ndarray) -> Tuple[Dict, None]:
     # basic points
     left_cheek = points[234]
     right_cheek = points[454]
@@ -101,34 +137,106 @@ def extract_features_one(image_path: str) -> Tuple[Optional[Dict], Optional[str]
     return feats, None
 
 
+def _features_from_rgb(
+    rgb_img: np.ndarray,
+    t0: float,
+    timings: Optional[Dict[str, float]] = None,
+) -> Tuple[Optional[Dict], Optional[str]]:
+    t1 = time.perf_counter()
+    points, err = _mesh_points(rgb_img, timings=timings)
+    t2 = time.perf_counter()
+    if timings is not None:
+        timings["decode"] = t1 - t0
+    if err is not None:
+        return None, err
+
+    feats, _ = _geometry_features(points)
+    if timings is not None:
+        timings["geometry"] = time.perf_counter() - t2
+    return feats, None
+
+
+def extract_features_one(
+    image_path: str,
+    timings: Optional[Dict[str, float]] = None,
+) -> Tuple[Optional[Dict], Optional[str]]:
+    """
+    Returns:
+      - features dict if success else None
+      - error_reason if failed else None
+    If `timings` is given, per-phase seconds are written into it
+    (decode / facemesh_lock_wait / facemesh / geometry) for the phases that ran.
+    """
+    t0 = time.perf_counter()
+    img = cv2.imread(image_path)
+    if img is None:
+        return None, "cv2_imread_failed"
+
+    rgb_img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    return _features_from_rgb(rgb_img, t0, timings=timings)
+
+
+def extract_features_bytes(
+    data: bytes,
+    timings: Optional[Dict[str, float]] = None,
+) -> Tuple[Optional[Dict], Optional[str]]:
+    """Same as extract_features_one, for an encoded image already in memory (API uploads)."""
+    t0 = time.perf_counter()
+    rgb_img, err = _decode_rgb(data)
+    if err is not None:
+        return None, err
+    return _features_from_rgb(rgb_img, t0, timings=timings)
+
+
+def _build_stages(pipeline: Optional[Dict] = None) -> List[Stage]:
+    fns = {
+        "read": _read_bytes,
+        "decode": _decode_rgb,
+        "facemesh": _mesh_points,
+        "geometry": _geometry_features,
+    }
+    pipeline = pipeline or {}
+    stages = []
+    for name, fn in fns.items():
+        cfg = {**DEFAULT_PIPELINE[name], **(pipeline.get(name) or {})}
+        for key in ("workers", "queue_depth"):
+            if int(cfg[key]) < 1:
+                raise ValueError(f"extract.pipeline.{name}.{key} must be >= 1, got {cfg[key]}")
+        stages.append(Stage(name, fn, workers=int(cfg["workers"]), queue_depth=int(cfg["queue_depth"])))
+    return stages
+
+
 def run_feature_extraction(
     samples: List[Sample],
     out_dir: str,
+    pipeline: Optional[Dict] = None,
 ) -> Dict:
     """
+    Staged extraction: read -> decode -> facemesh -> geometry -> writer,
+    each stage on its own threads with a bounded output queue, so disk reads
+    overlap with decoding and meshing.
     Writes:
-      - outputs/features.csv   (contract)
+      - outputs/features.csv   (contract, rows in sample order)
     Returns:
-      meta dict with counts
+      meta dict with counts and per-stage utilization
     """
     out = Path(out_dir)
     out.mkdir(parents=True, exist_ok=True)
 
-    rows = []
-    num_ok = 0
-    num_fail = 0
+    rows: List[Optional[Dict]] = [None] * len(samples)
+    counts = {"ok": 0, "fail": 0}
 
-    for s in samples:
-        feats, err = extract_features_one(s.path)
+    def _write(idx: int, feats: Optional[Dict], err: Optional[str]) -> None:
+        s = samples[idx]
         row = {
             "sample_id": s.sample_id,
             "path": s.path,
             "status": "ok" if err is None else "fail",
             "error": "" if err is None else err,
         }
-        if feats is not None:
+        if err is None:
             row.update(feats)
-            num_ok += 1
+            counts["ok"] += 1
         else:
             # keep feature columns but empty (NaN) —方便后续清洗统计
             row.update(
@@ -140,10 +248,11 @@ def run_feature_extraction(
                     "Mouth_Width": np.nan,
                 }
             )
-            num_fail += 1
-        rows.append(row)
+            counts["fail"] += 1
+        rows[idx] = row
+
+    stage_meta = run_stages((s.path for s in samples), _build_stages(pipeline), _write)
 
-    df = pd.DataFrame(rows)
     # 固定列顺序（契约稳定）
     cols = [
         "sample_id",
@@ -156,13 +265,14 @@ def run_feature_extraction(
         "Smile_Angle",
         "Mouth_Width",
     ]
-    df = df[cols]
+    df = pd.DataFrame(rows, columns=cols)
     out_csv = out / "features.csv"
     df.to_csv(out_csv, index=False, encoding="utf-8-sig")
 
     return {
         "num_samples": len(samples),
-        "num_ok": num_ok,
-        "num_fail": num_fail,
+        "num_ok": counts["ok"],
+        "num_fail": counts["fail"],
         "output": str(out_csv),
+        "pipeline": stage_meta,
     }
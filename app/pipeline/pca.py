@@ -5,9 +5,7 @@ from typing import Dict, List
 
 import numpy as np
 import pandas as pd
-import matplotlib
-matplotlib.use("Agg")
-import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
 from sklearn.decomposition import PCA
 
 
@@ -23,6 +21,7 @@ def run_pca(
     """
     Reads cleaned.csv, runs PCA on FEATURE_COLS, writes:
       - outputs/pca.png (contract)
+      - outputs/pca_coords.csv (sample_id + PC1..PCn, used by the dashboard)
     """
     out = Path(out_dir)
     out.mkdir(parents=True, exist_ok=True)
@@ -33,8 +32,8 @@ def run_pca(
     pca = PCA(n_components=n_components, random_state=seed)
     Z = pca.fit_transform(X)
 
-    # scatter PC1-PC2
-    fig = plt.figure()
+    # scatter PC1-PC2（OO Figure API，不经过 pyplot 的全局状态，可在 worker 线程/进程里调用）
+    fig = Figure()
     ax = fig.add_subplot(111)
     ax.scatter(Z[:, 0], Z[:, 1], s=12)
 
@@ -47,11 +46,25 @@ def run_pca(
     out_png = out / "pca.png"
     fig.tight_layout()
     fig.savefig(out_png, dpi=200)
-    plt.close(fig)
+
+    coords = pd.DataFrame(Z, columns=[f"PC{i + 1}" for i in range(Z.shape[1])])
+    coords.insert(0, "sample_id", df["sample_id"].to_numpy())
+    out_coords = out / "pca_coords.csv"
+    coords.to_csv(out_coords, index=False, encoding="utf-8-sig")
 
     return {
         "n": int(len(df)),
         "feature_cols": FEATURE_COLS,
         "explained_variance_ratio": [float(e) for e in evr[:2]],
         "output": str(out_png),
+        "coords_output": str(out_coords),
     }
+
+
+def pca_task(cleaned_path: str, out_dir: str, n_components: int, seed: int, done: Dict) -> Dict:
+    # scheduler Task 入口：模块级函数可 pickle；放在这里而不是 app.cli，
+    # spawn 出来的子进程只 import 本模块，不会把 extract.py 的 FaceMesh 也初始化一遍
+    # Step5: PCA
+    pca_meta = run_pca(cleaned_path, out_dir, n_components=n_components, seed=seed)
+    print(f"[pca] n={pca_meta['n']} -> {pca_meta['output']}", flush=True)
+    return pca_meta
@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+import multiprocessing
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+@dataclass(frozen=True)
+class Task:
+    name: str
+    fn: Callable[[Dict[str, Dict]], Dict]   # 参数：已完成依赖的 meta（name -> meta）
+    deps: Tuple[str, ...] = ()
+    # 主要在 Python 里跑、占着 GIL 的 task（如 matplotlib 渲染）放到子进程（spawn）；
+    # 此时 fn 必须可 pickle（模块级函数 / functools.partial），其所在模块会在子进程里重新 import
+    in_process: bool = False
+
+
+def _critical_path(tasks: Dict[str, Task], timing: Dict[str, Dict]) -> List[str]:
+    # 从最晚结束的 task 往回走，每步选结束最晚的依赖
+    name = max(timing, key=lambda n: timing[n]["end_sec"])
+    path = [name]
+    while tasks[name].deps:
+        name = max(tasks[name].deps, key=lambda n: timing[n]["end_sec"])
+        path.append(name)
+    return path[::-1]
+
+
+def run_tasks(tasks: List[Task], max_workers: int = 2) -> Tuple[Dict[str, Dict], Dict]:
+    """
+    Run a DAG of tasks on a thread pool; a task starts as soon as all its deps
+    are done, so independent tasks (e.g. PCA plot and regression) overlap.
+    Tasks with in_process=True run in a process pool so they also overlap with
+    GIL-bound work in other tasks.
+    Returns (metas by task name, timing dict with per-task start/end offsets,
+    the critical path and the measured overlap: sum of task durations - wall).
+    The first task exception is re-raised after running tasks finish.
+    """
+    by_name = {t.name: t for t in tasks}
+    if len(by_name) != len(tasks):
+        raise ValueError("duplicate task names")
+    for t in tasks:
+        missing = [d for d in t.deps if d not in by_name]
+        if missing:
+            raise ValueError(f"task {t.name!r} depends on unknown task(s): {missing}")
+
+    results: Dict[str, Dict] = {}
+    timing: Dict[str, Dict] = {}
+    pending = dict(by_name)
+    running: Dict[Future, str] = {}
+    proc_pool: Optional[ProcessPoolExecutor] = None
+    if any(t.in_process for t in tasks):
+        # spawn 而不是 Linux 默认的 fork：子进程在 task 线程里、其他 task 正跑 pandas/sklearn、
+        # FaceMesh 线程已启动时才创建，fork 多线程进程可能在 BLAS / malloc 的锁上死锁
+        proc_pool = ProcessPoolExecutor(
+            max_workers=max(1, sum(t.in_process for t in tasks)),
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    t_start = time.perf_counter()
+
+    def _timed(task: Task, deps: Dict[str, Dict]) -> Dict:
+        t0 = time.perf_counter()
+        try:
+            if task.in_process:
+                return proc_pool.submit(task.fn, deps).result()
+            return task.fn(deps)
+        finally:
+            t1 = time.perf_counter()
+            timing[task.name] = {
+                "deps": list(task.deps),
+                "start_sec": round(t0 - t_start, 4),
+                "end_sec": round(t1 - t_start, 4),
+                "duration_sec": round(t1 - t0, 4),
+            }
+
+    try:
+        _run(pool_size=max(1, max_workers), pending=pending, running=running, results=results, timed=_timed)
+    finally:
+        if proc_pool is not None:
+            proc_pool.shutdown(wait=True)
+
+    wall = time.perf_counter() - t_start
+    path = _critical_path(by_name, timing) if timing else []
+    busy = sum(t["duration_sec"] for t in timing.values())
+    return results, {
+        "wall_sec": round(wall, 4),
+        "max_workers": max_workers,
+        "tasks": timing,
+        "critical_path": path,
+        "critical_path_sec": round(sum(timing[n]["duration_sec"] for n in path), 4),
+        # >0 表示并行真正省下的时间（相对于串行执行所有 task）
+        "overlap_sec": round(max(0.0, busy - wall), 4),
+    }
+
+
+def _run(pool_size: int, pending: Dict, running: Dict, results: Dict, timed: Callable) -> None:
+    with ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="task") as pool:
+        while pending or running:
+            ready = [t for t in pending.values() if all(d in results for d in t.deps)]
+            for t in ready:
+                del pending[t.name]
+                running[pool.submit(timed, t, {d: results[d] for d in t.deps})] = t.name
+            if not running:
+                raise ValueError(f"dependency cycle among tasks: {sorted(pending)}")
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in done:
+                name = running.pop(fut)
+                exc = fut.exception()
+                if exc is not None:
+                    pending.clear()
+                    wait(running)
+                    raise exc
+                results[name] = fut.result()
@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+import pickle
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+from sklearn.decomposition import PCA
+from sklearn.neighbors import KDTree
+
+
+FEATURE_COLS = ["fWHR", "EFR", "ESI", "Smile_Angle", "Mouth_Width"]
+
+
+class SimilarIndex:
+    """
+    KD-tree over the cleaned corpus in standardized feature space
+    (optionally projected onto the first PCA components).
+
+    Only positions are stored: row i of the tree is row i of the feature
+    store generation it was published with, and sample ids are resolved
+    through that generation's memory-mapped sample_ids.npy, so API workers
+    do not each hold a Python copy of the ids.
+    """
+
+    def __init__(
+        self,
+        X: np.ndarray,
+        space: str = "standardized",
+        n_components: int = 2,
+        leaf_size: int = 40,
+        seed: int = 42,
+    ):
+        if space not in ("standardized", "pca"):
+            raise ValueError(f"unknown similar space: {space}")
+
+        self.space = space
+        self.mean = X.mean(axis=0)
+        std = X.std(axis=0)
+        self.std = np.where(std > 0, std, 1.0)
+
+        Z = (X - self.mean) / self.std
+        self.pca: Optional[PCA] = None
+        if space == "pca":
+            self.pca = PCA(n_components=n_components, random_state=seed).fit(Z)
+            Z = self.pca.transform(Z)
+
+        self.tree = KDTree(Z, leaf_size=leaf_size)
+
+    def __len__(self) -> int:
+        return int(np.asarray(self.tree.data).shape[0])
+
+    def transform(self, X: np.ndarray) -> np.ndarray:
+        Z = (np.atleast_2d(np.asarray(X, dtype=float)) - self.mean) / self.std
+        return self.pca.transform(Z) if self.pca is not None else Z
+
+    @staticmethod
+    def _check_k(k: int) -> None:
+        if k < 1:
+            raise ValueError(f"k must be >= 1, got {k}")
+
+    def query_features(self, feats: Dict, k: int = 5) -> Tuple[np.ndarray, np.ndarray]:
+        """Returns (distances, positions) of the k nearest corpus rows; ValueError on NaN features."""
+        self._check_k(k)
+        x = [[feats[c] for c in FEATURE_COLS]]
+        # ESI / fWHR 可能是 NaN，KDTree.query 会直接报错
+        bad = [c for c, v in zip(FEATURE_COLS, x[0]) if v is None or np.isnan(v)]
+        if bad:
+            raise ValueError(f"features are NaN: {bad}")
+        dist, ind = self.tree.query(self.transform(x), k=min(k, len(self)))
+        return dist[0], ind[0]
+
+    def query_position(self, i: int, k: int = 5) -> Tuple[np.ndarray, np.ndarray]:
+        """Neighbours of corpus row i (row i itself is excluded)."""
+        self._check_k(k)
+        z = np.asarray(self.tree.data[i : i + 1])
+        dist, ind = self.tree.query(z, k=min(k + 1, len(self)))
+        keep = ind[0] != i
+        return dist[0][keep][:k], ind[0][keep][:k]
+
+
+def build_similar_index(
+    X: np.ndarray,
+    out_path: str,
+    space: str = "standardized",
+    n_components: int = 2,
+    leaf_size: int = 40,
+    seed: int = 42,
+) -> Dict:
+    """
+    Builds the nearest-neighbour index over X (columns = FEATURE_COLS), writes:
+      - out_path (pickle; the feature store puts it inside its generation dir)
+    """
+    index = SimilarIndex(X, space=space, n_components=n_components, leaf_size=leaf_size, seed=seed)
+    with open(out_path, "wb") as f:
+        pickle.dump(index, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    return {
+        "n": len(index),
+        "space": space,
+        "feature_cols": FEATURE_COLS,
+        "output": str(out_path),
+    }
+
+
+def load_similar_index(path: str) -> SimilarIndex:
+    p = Path(path)
+    if not p.exists():
+        raise FileNotFoundError(f"{path} not found. Run pipeline first.")
+    with open(p, "rb") as f:
+        return pickle.load(f)
@@ -0,0 +1,152 @@
+from __future__ import annotations
+
+import queue
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+
+# 一个 item 在各 stage 之间流动：(idx, payload, error)
+# error 一旦非空，后续 stage 直接透传，不再调用 fn
+Item = Tuple[int, Any, Optional[str]]
+
+_DONE = object()
+
+
+@dataclass
+class Stage:
+    name: str
+    fn: Callable[[Any], Tuple[Any, Optional[str]]]
+    workers: int = 1
+    queue_depth: int = 16   # 输出队列容量（满了就阻塞上游 = backpressure）
+
+
+class _StageStats:
+    def __init__(self, workers: int):
+        self.workers = workers
+        self.busy_sec = 0.0      # 在 fn 里的时间
+        self.starved_sec = 0.0   # 等上游给数据的时间
+        self.blocked_sec = 0.0   # 等下游腾位置的时间
+        self.n_items = 0
+        self._lock = threading.Lock()
+
+    def add(self, busy: float, starved: float, blocked: float) -> None:
+        with self._lock:
+            self.busy_sec += busy
+            self.starved_sec += starved
+            self.blocked_sec += blocked
+            self.n_items += 1
+
+    def to_dict(self, wall_sec: float) -> Dict:
+        capacity = wall_sec * self.workers
+        return {
+            "workers": self.workers,
+            "n_items": self.n_items,
+            "busy_sec": round(self.busy_sec, 4),
+            "starved_sec": round(self.starved_sec, 4),
+            "blocked_sec": round(self.blocked_sec, 4),
+            "utilization": round(self.busy_sec / capacity, 4) if capacity > 0 else 0.0,
+        }
+
+
+def _stage_worker(
+    stage: Stage,
+    q_in: "queue.Queue",
+    q_out: "queue.Queue",
+    stats: _StageStats,
+    alive: List[int],
+    alive_lock: threading.Lock,
+) -> None:
+    while True:
+        t0 = time.perf_counter()
+        item = q_in.get()
+        t1 = time.perf_counter()
+        if item is _DONE:
+            # 放回去让同 stage 的其他 worker 也能看到；最后一个退出的 worker 通知下游
+            q_in.put(_DONE)
+            with alive_lock:
+                alive[0] -= 1
+                last = alive[0] == 0
+            if last:
+                q_out.put(_DONE)
+            return
+
+        idx, payload, err = item
+        if err is None:
+            try:
+                payload, err = stage.fn(payload)
+            except Exception as e:
+                payload, err = None, f"exception:{type(e).__name__}"
+        t2 = time.perf_counter()
+        q_out.put((idx, payload, err))
+        t3 = time.perf_counter()
+        stats.add(busy=t2 - t1, starved=t1 - t0, blocked=t3 - t2)
+
+
+def run_stages(
+    payloads: Iterable[Any],
+    stages: List[Stage],
+    sink: Callable[[int, Any, Optional[str]], None],
+) -> Dict:
+    """
+    Run payloads through `stages` as a threaded pipeline with bounded queues.
+    Each stage has its own worker threads; items may finish out of order,
+    `sink(idx, payload, error)` is called on the caller's thread for every item.
+    Returns per-stage stats (busy / starved / blocked seconds, utilization).
+    """
+    for st in stages:
+        # workers=0 时没有线程把 _DONE 传下去，整个 pipeline 会永远卡住
+        if st.workers < 1 or st.queue_depth < 1:
+            raise ValueError(f"stage {st.name!r}: workers and queue_depth must be >= 1")
+
+    t_start = time.perf_counter()
+
+    # source 队列不设上限：输入只是路径等轻量对象
+    q_src: "queue.Queue" = queue.Queue()
+    n = 0
+    for i, p in enumerate(payloads):
+        q_src.put((i, p, None))
+        n += 1
+    q_src.put(_DONE)
+
+    stats: Dict[str, _StageStats] = {}
+    threads: List[threading.Thread] = []
+    q_in = q_src
+    for st in stages:
+        q_out: "queue.Queue" = queue.Queue(maxsize=st.queue_depth)
+        stats[st.name] = _StageStats(st.workers)
+        alive = [st.workers]
+        alive_lock = threading.Lock()
+        for w in range(st.workers):
+            t = threading.Thread(
+                target=_stage_worker,
+                args=(st, q_in, q_out, stats[st.name], alive, alive_lock),
+                name=f"stage-{st.name}-{w}",
+                daemon=True,
+            )
+            t.start()
+            threads.append(t)
+        q_in = q_out
+
+    sink_busy = 0.0
+    while True:
+        item = q_in.get()
+        if item is _DONE:
+            break
+        t0 = time.perf_counter()
+        sink(*item)
+        sink_busy += time.perf_counter() - t0
+
+    for t in threads:
+        t.join()
+
+    wall = time.perf_counter() - t_start
+    out = {name: s.to_dict(wall) for name, s in stats.items()}
+    out["sink"] = {
+        "workers": 1,
+        "n_items": n,
+        "busy_sec": round(sink_busy, 4),
+        "utilization": round(sink_busy / wall, 4) if wall > 0 else 0.0,
+    }
+    return {"wall_sec": round(wall, 4), "stages": out}
@@ -0,0 +1,181 @@
+from __future__ import annotations
+
+import json
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from .similar import FEATURE_COLS as SIMILAR_COLS, SimilarIndex, build_similar_index, load_similar_index
+
+
+# 列顺序：回归用的 X 列（fWHR, EFR, ESI, Mouth_Width）排成连续一段，
+# features[:, 0:4] 是 view，/predict 拟合时不用再复制一份 n×4
+FEATURE_COLS = ["fWHR", "EFR", "ESI", "Mouth_Width", "Smile_Angle"]
+
+# 布局：
+#   outputs/store/CURRENT           -> 当前 generation 名（原子替换）
+#   outputs/store/gen-000003/features.npy      float64 (n, len(FEATURE_COLS))
+#   outputs/store/gen-000003/sample_ids.npy    定长 unicode，可 mmap
+#   outputs/store/gen-000003/id_order.npy      int64 argsort(sample_ids)，sample_id -> 行号用二分查找
+#   outputs/store/gen-000003/similar_index.pkl 同一 generation 的 KD-tree（行号与上面对齐）
+#   outputs/store/gen-000003/meta.json
+
+
+def _next_generation(root: Path) -> int:
+    gens = [int(p.name.split("-", 1)[1]) for p in root.glob("gen-*") if p.name.split("-", 1)[1].isdigit()]
+    return max(gens, default=0) + 1
+
+
+def publish_feature_store(
+    cleaned_csv: str,
+    out_dir: str,
+    keep: int = 2,
+    similar: Optional[Dict] = None,
+    seed: int = 42,
+) -> Dict:
+    """
+    Publishes cleaned.csv as a read-only memory-mappable store under
+    out_dir/store. With `similar` (the config section), the nearest-neighbour
+    index is built into the same generation, so ids, features and index are
+    always switched together. The new generation is fully written before
+    CURRENT is switched with an atomic rename, so readers never see a partial
+    store. Older generations beyond `keep` are removed (already-mapped files
+    stay valid for processes that still hold them).
+    """
+    root = Path(out_dir) / "store"
+    root.mkdir(parents=True, exist_ok=True)
+
+    df = pd.read_csv(cleaned_csv)
+    X = np.ascontiguousarray(df[FEATURE_COLS].to_numpy(dtype=np.float64))
+    ids = df["sample_id"].astype(str).to_numpy()
+    ids = ids.astype(f"<U{max(1, max((len(s) for s in ids), default=1))}")
+
+    gen = _next_generation(root)
+    name = f"gen-{gen:06d}"
+    tmp_dir = root / f".{name}.tmp"
+    if tmp_dir.exists():
+        shutil.rmtree(tmp_dir)
+    tmp_dir.mkdir()
+
+    np.save(tmp_dir / "features.npy", X)
+    np.save(tmp_dir / "sample_ids.npy", ids)
+    np.save(tmp_dir / "id_order.npy", np.argsort(ids, kind="stable").astype(np.int64))
+
+    sim_meta = None
+    if similar is not None:
+        sim_meta = build_similar_index(
+            df[SIMILAR_COLS].to_numpy(dtype=float),
+            str(tmp_dir / "similar_index.pkl"),
+            space=similar.get("space", "standardized"),
+            n_components=int(similar.get("n_components", 2)),
+            leaf_size=int(similar.get("leaf_size", 40)),
+            seed=seed,
+        )
+        sim_meta["output"] = str(root / name / "similar_index.pkl")
+
+    meta = {
+        "generation": gen,
+        "source": str(cleaned_csv),
+        "n": int(len(df)),
+        "columns": FEATURE_COLS,
+        "similar": sim_meta,
+        "created_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+    (tmp_dir / "meta.json").write_text(json.dumps(meta, ensure_ascii=False, indent=2), encoding="utf-8")
+    tmp_dir.rename(root / name)
+
+    current_tmp = root / "CURRENT.tmp"
+    current_tmp.write_text(name, encoding="utf-8")
+    os.replace(current_tmp, root / "CURRENT")
+
+    old = sorted(p for p in root.glob("gen-*") if p.name != name)
+    for p in old[: max(0, len(old) - (keep - 1))]:
+        shutil.rmtree(p, ignore_errors=True)
+
+    return {"n": meta["n"], "generation": gen, "output": str(root / name), "similar": sim_meta}
+
+
+class StoreGeneration:
+    """
+    One published generation, memory-mapped read-only. Everything that scales
+    with the corpus (features, sample ids, id -> row lookup) lives in the
+    mapped files; only the KD-tree is unpickled per process, lazily.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        meta = json.loads((self.path / "meta.json").read_text(encoding="utf-8"))
+        self.generation: int = int(meta["generation"])
+        self.columns: List[str] = list(meta["columns"])
+        self.features: np.ndarray = np.load(self.path / "features.npy", mmap_mode="r")
+        self.sample_ids: np.ndarray = np.load(self.path / "sample_ids.npy", mmap_mode="r")
+        self.id_order: np.ndarray = np.load(self.path / "id_order.npy", mmap_mode="r")
+        self._similar: Optional[SimilarIndex] = None
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return int(self.features.shape[0])
+
+    def column(self, name: str) -> np.ndarray:
+        return self.features[:, self.columns.index(name)]
+
+    def matrix(self, names: List[str]) -> np.ndarray:
+        idx = [self.columns.index(c) for c in names]
+        if idx == list(range(idx[0], idx[0] + len(idx))):
+            # 连续列：切片是 mmap 上的 view，不复制
+            return self.features[:, idx[0] : idx[-1] + 1]
+        return self.features[:, idx]
+
+    def position(self, sample_id: str) -> Optional[int]:
+        """Row of sample_id, by binary search over the mapped id_order (None if unknown)."""
+        j = int(np.searchsorted(self.sample_ids, sample_id, sorter=self.id_order))
+        if j < len(self) and self.sample_ids[self.id_order[j]] == sample_id:
+            return int(self.id_order[j])
+        return None
+
+    def similar(self) -> SimilarIndex:
+        with self._lock:
+            if self._similar is None:
+                self._similar = load_similar_index(str(self.path / "similar_index.pkl"))
+            return self._similar
+
+    def neighbours(self, dist: np.ndarray, ind: np.ndarray) -> List[Dict]:
+        return [
+            {"sample_id": str(self.sample_ids[i]), "distance": float(d)}
+            for d, i in zip(dist, ind)
+        ]
+
+
+class FeatureStore:
+    """
+    Reader side: maps the CURRENT generation zero-copy (np.load mmap_mode="r"),
+    so all uvicorn workers share the page cache instead of holding their own
+    DataFrame. current() re-reads CURRENT (a few bytes) and remaps when the
+    generation name changes; generation numbers only grow, so a republish
+    is never missed even where file timestamps are coarse.
+    """
+
+    def __init__(self, root: str):
+        self.root = Path(root)
+        self._gen: Optional[StoreGeneration] = None
+        self._name: Optional[str] = None
+        self._lock = threading.Lock()
+
+    def current(self) -> StoreGeneration:
+        pointer = self.root / "CURRENT"
+        try:
+            name = pointer.read_text(encoding="utf-8").strip()
+        except FileNotFoundError:
+            raise FileNotFoundError(f"{pointer} not found. Run pipeline first.")
+
+        with self._lock:
+            if self._gen is None or name != self._name:
+                self._gen = StoreGeneration(self.root / name)
+                self._name = name
+            return self._gen
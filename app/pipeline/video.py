@@ -0,0 +1,220 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+import re
+import time
+
+import cv2
+import mediapipe as mp
+import numpy as np
+import pandas as pd
+
+from .extract import _geometry_features, _landmark_points
+
+
+FEATURE_COLS = ["fWHR", "EFR", "ESI", "Smile_Angle", "Mouth_Width"]
+VIDEO_SUFFIXES = {".mp4", ".avi", ".mov", ".mkv", ".webm"}
+
+
+@dataclass(frozen=True)
+class Clip:
+    clip_id: str
+    path: str
+    kind: str   # "video" | "frames"
+
+
+def read_clips(input_dir: str) -> Tuple[List[Clip], dict]:
+    """
+    Clips under input_dir:
+      - video files (*.mp4, *.avi, *.mov, *.mkv, *.webm); files OpenCV cannot open are skipped
+      - sub-directories of ordered PNG frames (natural sort by file name: frame_2 < frame_10)
+    """
+    t0 = time.time()
+    p = Path(input_dir)
+
+    meta = {
+        "input_dir": str(p),
+        "pattern": "videos + <dir>/*.png",
+        "num_found": 0,
+        "num_ok": 0,
+        "num_skipped": 0,
+        "skipped": [],
+        "elapsed_sec": None,
+    }
+
+    if not p.exists() or not p.is_dir():
+        meta["skipped"].append({"file": str(p), "reason": "input_dir_not_found_or_not_dir"})
+        meta["num_skipped"] = 1
+        meta["elapsed_sec"] = round(time.time() - t0, 4)
+        return [], meta
+
+    clips: List[Clip] = []
+    entries = sorted(p.iterdir())
+    for f in entries:
+        try:
+            if f.is_file() and f.suffix.lower() in VIDEO_SUFFIXES:
+                meta["num_found"] += 1
+                if f.stat().st_size == 0:
+                    meta["skipped"].append({"file": str(f), "reason": "empty_or_missing"})
+                    continue
+                cap = cv2.VideoCapture(str(f))
+                opened = cap.isOpened()
+                cap.release()
+                if not opened:
+                    # 编码不支持 / 文件损坏：记到 io_log，不要变成 n_frames=0 的“空” clip
+                    meta["skipped"].append({"file": str(f), "reason": "video_open_failed"})
+                    continue
+                clips.append(Clip(clip_id=f.stem, path=str(f), kind="video"))
+            elif f.is_dir():
+                meta["num_found"] += 1
+                if not any(f.glob("*.png")):
+                    meta["skipped"].append({"file": str(f), "reason": "no_png_frames"})
+                    continue
+                clips.append(Clip(clip_id=f.name, path=str(f), kind="frames"))
+        except Exception as e:
+            meta["skipped"].append({"file": str(f), "reason": f"exception:{type(e).__name__}"})
+
+    meta["num_ok"] = len(clips)
+    meta["num_skipped"] = len(meta["skipped"])
+    meta["elapsed_sec"] = round(time.time() - t0, 4)
+    return clips, meta
+
+
+def _natural_key(p: Path) -> list:
+    # frame_2.png 排在 frame_10.png 前面（不要求文件名补零）
+    return [int(t) if t.isdigit() else t.lower() for t in re.split(r"(\d+)", p.name)]
+
+
+def _iter_frames(clip: Clip, stride: int = 1) -> Iterator[Tuple[int, str, Optional[np.ndarray], Optional[str]]]:
+    """
+    Yield (frame_idx, source, rgb_frame or None, error). A video that cannot
+    be opened or whose first frame cannot be decoded yields a single failed
+    frame 0, so the clip shows up in features.csv instead of silently having
+    no frames.
+    """
+    if clip.kind == "video":
+        cap = cv2.VideoCapture(clip.path)
+        try:
+            if not cap.isOpened():
+                yield 0, clip.path, None, "video_open_failed"
+                return
+            idx = 0
+            while True:
+                if idx % stride:
+                    # grab() 跳帧不解码，比 read() 便宜
+                    if not cap.grab():
+                        break
+                else:
+                    ok, bgr = cap.read()
+                    if not ok:
+                        if idx == 0:
+                            yield 0, clip.path, None, "video_decode_failed"
+                        break
+                    yield idx, clip.path, cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB), None
+                idx += 1
+        finally:
+            cap.release()
+    else:
+        for idx, f in enumerate(sorted(Path(clip.path).glob("*.png"), key=_natural_key)):
+            if idx % stride:
+                continue
+            bgr = cv2.imread(str(f))
+            if bgr is None:
+                yield idx, str(f), None, "cv2_imread_failed"
+            else:
+                yield idx, str(f), cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB), None
+
+
+def run_video_extraction(
+    clips: List[Clip],
+    out_dir: str,
+    frame_stride: int = 1,
+) -> Dict:
+    """
+    Per-frame extraction with FaceMesh in tracking mode (static_image_mode=False):
+    face detection only reruns when tracking is lost. One FaceMesh per clip so
+    tracking state never leaks across clips.
+    Writes:
+      - outputs/features.csv   (contract columns + clip_id, frame; one row per frame)
+      - outputs/clips.csv      (per-clip aggregates: frame counts, mean/std per feature)
+    """
+    if frame_stride < 1:
+        raise ValueError(f"frame_stride must be >= 1, got {frame_stride}")
+
+    out = Path(out_dir)
+    out.mkdir(parents=True, exist_ok=True)
+
+    rows = []
+    clip_rows = []
+    num_ok = 0
+    num_fail = 0
+    t0 = time.perf_counter()
+
+    for clip in clips:
+        clip_feats = []
+        n_frames = 0
+        with mp.solutions.face_mesh.FaceMesh(static_image_mode=False, max_num_faces=1) as face_mesh:
+            for idx, src, rgb, err in _iter_frames(clip, stride=frame_stride):
+                n_frames += 1
+                feats = None
+                if err is None:
+                    h, w = rgb.shape[:2]
+                    points, err = _landmark_points(face_mesh.process(rgb), w, h)
+                    if err is None:
+                        feats, _ = _geometry_features(points)
+
+                row = {
+                    "sample_id": f"{clip.clip_id}#{idx:06d}",
+                    "path": src,
+                    "status": "ok" if err is None else "fail",
+                    "error": "" if err is None else err,
+                }
+                if feats is not None:
+                    row.update(feats)
+                    clip_feats.append(feats)
+                    num_ok += 1
+                else:
+                    row.update({c: np.nan for c in FEATURE_COLS})
+                    num_fail += 1
+                row["clip_id"] = clip.clip_id
+                row["frame"] = idx
+                rows.append(row)
+
+        agg = {"clip_id": clip.clip_id, "path": clip.path, "n_frames": n_frames, "n_ok": len(clip_feats)}
+        F = pd.DataFrame(clip_feats, columns=FEATURE_COLS)
+        for c in FEATURE_COLS:
+            agg[f"{c}_mean"] = float(F[c].mean()) if len(F) else np.nan
+            agg[f"{c}_std"] = float(F[c].std(ddof=0)) if len(F) else np.nan
+        clip_rows.append(agg)
+
+    elapsed = time.perf_counter() - t0
+
+    # 固定列顺序（契约列在前）
+    cols = [
+        "sample_id",
+        "path",
+        "status",
+        "error",
+        *FEATURE_COLS,
+        "clip_id",
+        "frame",
+    ]
+    df = pd.DataFrame(rows, columns=cols)
+    out_csv = out / "features.csv"
+    df.to_csv(out_csv, index=False, encoding="utf-8-sig")
+
+    clip_cols = ["clip_id", "path", "n_frames", "n_ok"] + [f"{c}_{s}" for c in FEATURE_COLS for s in ("mean", "std")]
+    clips_csv = out / "clips.csv"
+    pd.DataFrame(clip_rows, columns=clip_cols).to_csv(clips_csv, index=False, encoding="utf-8-sig")
+
+    return {
+        "num_clips": len(clips),
+        "num_samples": len(rows),
+        "num_ok": num_ok,
+        "num_fail": num_fail,
+        "frames_per_sec": round(len(rows) / elapsed, 2) if elapsed > 0 else None,
+        "output": str(out_csv),
+        "clips_output": str(clips_csv),
+    }
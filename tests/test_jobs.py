@@ -0,0 +1,169 @@
+import logging
+import threading
+import time
+import zipfile
+from collections import Counter
+from pathlib import Path
+
+import pytest
+
+from app.jobs import JobQueue
+
+
+def _make_inputs(d, n):
+    d.mkdir(parents=True, exist_ok=True)
+    for i in range(n):
+        (d / f"{i:03d}.png").write_bytes(b"x")
+    return str(d)
+
+
+def _fake_extract(path):
+    if path.endswith("002.png"):
+        return None, "no_face_detected"
+    return {"fWHR": 1.0, "EFR": 0.1, "ESI": float("nan"), "Smile_Angle": 2.0, "Mouth_Width": 3.0}, None
+
+
+def _fake_predict(feats):
+    return {"Smile_Angle": feats["fWHR"] * 10}
+
+
+def _wait_done(q, job_id, timeout=10.0):
+    t0 = time.time()
+    while time.time() - t0 < timeout:
+        job = q.get(job_id)
+        if job["status"] == "done":
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"job not done: {q.get(job_id)}")
+
+
+def test_job_progress_and_results_order(tmp_path):
+    q = JobQueue(
+        str(tmp_path / "jobs.sqlite3"), str(tmp_path / "work"),
+        num_workers=2, poll_sec=0.05, extract_fn=_fake_extract, predict_fn=_fake_predict,
+    )
+    job = q.submit(_make_inputs(tmp_path / "in", 6))
+    assert job["status"] == "queued"
+    assert job["num_samples"] == 6 and job["progress"] == 0.0
+
+    q.start()
+    try:
+        job = _wait_done(q, job["job_id"])
+    finally:
+        q.stop()
+
+    assert (job["num_ok"], job["num_fail"], job["progress"]) == (5, 1, 1.0)
+
+    rows = list(q.iter_results(job["job_id"], batch_size=2))
+    assert [r["sample_id"] for r in rows] == [f"{i:03d}" for i in range(6)]
+    assert rows[0]["ESI"] is None and rows[0]["prediction"] == {"Smile_Angle": 10.0}
+    failed = rows[2]
+    assert failed["status"] == "fail" and failed["error"] == "no_face_detected"
+    assert failed["fWHR"] is None and failed["prediction"] is None
+
+
+def test_job_resumes_after_crash_but_not_live_leases(tmp_path):
+    db, work = str(tmp_path / "jobs.sqlite3"), str(tmp_path / "work")
+    inputs = _make_inputs(tmp_path / "in", 4)
+
+    # crashed worker: claims item 0 with a short lease and never finishes it
+    crashed = JobQueue(db, work, lease_sec=0.2, extract_fn=_fake_extract)
+    job = crashed.submit(inputs)
+    assert crashed._claim()["idx"] == 0
+
+    # live worker: holds item 1 under a long lease
+    live = JobQueue(db, work, lease_sec=60, extract_fn=_fake_extract)
+    held = live._claim()
+    assert held["idx"] == 1
+
+    restarted = JobQueue(db, work, poll_sec=0.05, lease_sec=60, extract_fn=_fake_extract)
+    restarted.start()
+    try:
+        time.sleep(0.5)
+        job = restarted.get(job["job_id"])
+        # item 0 recovered after its lease expired, item 1 still belongs to the live worker
+        assert job["num_done"] == 3 and job["status"] == "running"
+
+        live._finish(held["job_id"], held["idx"], *_fake_extract(held["path"]))
+        job = _wait_done(restarted, job["job_id"])
+    finally:
+        restarted.stop()
+    assert job["num_done"] == 4
+
+
+def test_job_queue_shared_by_processes_claims_each_sample_once(tmp_path):
+    db, work = str(tmp_path / "jobs.sqlite3"), str(tmp_path / "work")
+    calls = Counter()
+    lock = threading.Lock()
+
+    def counting_extract(path):
+        with lock:
+            calls[path] += 1
+        return _fake_extract(path)
+
+    queues = [
+        JobQueue(db, work, num_workers=2, poll_sec=0.01, extract_fn=counting_extract)
+        for _ in range(4)
+    ]
+    job = queues[0].submit(_make_inputs(tmp_path / "in", 100))
+    for q in queues:
+        q.start()
+    try:
+        job = _wait_done(queues[0], job["job_id"], timeout=30)
+    finally:
+        for q in queues:
+            q.stop()
+
+    assert job["num_done"] == 100
+    assert len(calls) == 100 and set(calls.values()) == {1}
+
+
+def _make_zip(path, members):
+    with zipfile.ZipFile(path, "w") as zf:
+        for name, data in members.items():
+            zf.writestr(name, data)
+    return str(path)
+
+
+def test_unpack_archive_rejects_duplicate_names_and_cleans_up(tmp_path):
+    q = JobQueue(str(tmp_path / "jobs.sqlite3"), str(tmp_path / "work"), extract_fn=_fake_extract)
+    archive = _make_zip(tmp_path / "dup.zip", {"a/001.png": b"x", "b/001.png": b"y"})
+
+    with pytest.raises(ValueError, match="duplicate"):
+        q.unpack_archive("job1", archive)
+    assert not (tmp_path / "work" / "job1").exists()
+
+
+def test_unpack_archive_caps_extracted_size(tmp_path):
+    q = JobQueue(
+        str(tmp_path / "jobs.sqlite3"), str(tmp_path / "work"),
+        max_unpacked_bytes=1000, extract_fn=_fake_extract,
+    )
+    ok = _make_zip(tmp_path / "ok.zip", {"a/001.png": b"x" * 400, "b/002.png": b"y" * 400, "notes.txt": b"z" * 5000})
+    input_dir = q.unpack_archive("job1", ok)
+    assert sorted(p.name for p in Path(input_dir).iterdir()) == ["001.png", "002.png"]
+
+    big = _make_zip(tmp_path / "big.zip", {"001.png": b"x" * 600, "002.png": b"y" * 600})
+    with pytest.raises(ValueError, match="expands beyond"):
+        q.unpack_archive("job2", big)
+    assert not (tmp_path / "work" / "job2").exists()
+
+
+def test_prediction_failure_logged_once_per_job(tmp_path, caplog):
+    def broken_predict(feats):
+        raise FileNotFoundError("outputs/store/CURRENT not found")
+
+    q = JobQueue(
+        str(tmp_path / "jobs.sqlite3"), str(tmp_path / "work"),
+        poll_sec=0.05, extract_fn=_fake_extract, predict_fn=broken_predict,
+    )
+    job = q.submit(_make_inputs(tmp_path / "in", 5))
+    with caplog.at_level(logging.ERROR, logger="app.jobs"):
+        q.start()
+        try:
+            job = _wait_done(q, job["job_id"])
+        finally:
+            q.stop()
+
+    assert job["num_ok"] == 4
+    assert len([r for r in caplog.records if "prediction failed" in r.getMessage()]) == 1
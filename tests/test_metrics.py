@@ -0,0 +1,54 @@
+import asyncio
+from types import SimpleNamespace
+
+from app import metrics
+from app.metrics import Counter, Histogram
+
+
+def test_histogram_render_cumulative_buckets():
+    h = Histogram("phase_seconds", "test", ("phase",), buckets=(0.1, 1.0))
+    for v in [0.05, 0.1, 0.5, 2.0]:
+        h.observe(v, "decode")
+
+    lines = h.render()
+    assert 'phase_seconds_bucket{phase="decode",le="0.1"} 2' in lines  # le is inclusive
+    assert 'phase_seconds_bucket{phase="decode",le="1"} 3' in lines
+    assert 'phase_seconds_bucket{phase="decode",le="+Inf"} 4' in lines
+    assert 'phase_seconds_count{phase="decode"} 4' in lines
+    assert 'phase_seconds_sum{phase="decode"} 2.65' in lines
+
+
+def test_label_values_are_escaped():
+    c = Counter("errors_total", "test", ("reason",))
+    c.inc('bad "quote"\\\n')
+    assert 'errors_total{reason="bad \\"quote\\"\\\\\\n"} 1' in c.render()
+
+
+def test_request_middleware_times_streamed_body_to_the_end():
+    async def streaming_app(scope, receive, send):
+        scope["route"] = SimpleNamespace(path="/jobs/{job_id}/results")
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"a\n", "more_body": True})
+        await asyncio.sleep(0.05)
+        await send({"type": "http.response.body", "body": b"b\n"})
+
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    async def receive():
+        return {"type": "http.request"}
+
+    mw = metrics.RequestMetricsMiddleware(streaming_app)
+    asyncio.run(mw({"type": "http", "method": "GET"}, receive, send))
+
+    assert len(sent) == 3
+    assert 'avatar_http_requests_total{method="GET",route="/jobs/{job_id}/results",status="200"} 1' in (
+        metrics.REQUESTS.render()
+    )
+    lines = metrics.REQUEST_LATENCY.render()
+    prefix = 'avatar_http_request_duration_seconds_sum{method="GET",route="/jobs/{job_id}/results"}'
+    total = [line for line in lines if line.startswith(prefix)]
+    assert float(total[0].rsplit(" ", 1)[1]) >= 0.05
+    assert 'avatar_http_requests_in_flight 0' in metrics.IN_FLIGHT.render()
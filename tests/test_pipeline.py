@@ -38,3 +38,13 @@ def test_pca_png_exists():
     f = OUT_DIR / "pca.png"
     assert f.exists(), "outputs/pca.png not found"
     assert f.stat().st_size > 0, "outputs/pca.png is empty"
+
+
+def test_feature_store_current_generation():
+    current = OUT_DIR / "store" / "CURRENT"
+    assert current.exists(), "outputs/store/CURRENT not found"
+
+    gen_dir = OUT_DIR / "store" / current.read_text(encoding="utf-8").strip()
+    for name in ["features.npy", "sample_ids.npy", "id_order.npy", "similar_index.pkl", "meta.json"]:
+        assert (gen_dir / name).exists(), f"missing store file: {name}"
+    assert (gen_dir / "similar_index.pkl").stat().st_size > 0, "similar_index.pkl is empty"
@@ -0,0 +1,74 @@
+import os
+import time
+
+import pytest
+
+from app.pipeline.scheduler import Task, run_tasks
+
+
+def _sleep(sec, name):
+    def fn(done):
+        time.sleep(sec)
+        return {"name": name, "deps": sorted(done)}
+    return fn
+
+
+def _child_pid(done):
+    return {"pid": os.getpid()}
+
+
+def test_run_tasks_overlaps_independent_tasks_and_passes_dep_metas():
+    tasks = [
+        Task("clean", _sleep(0.05, "clean")),
+        Task("pca", _sleep(0.3, "pca"), deps=("clean",)),
+        Task("regress", _sleep(0.2, "regress"), deps=("clean",)),
+        Task("report", _sleep(0.05, "report"), deps=("clean", "pca", "regress")),
+    ]
+    metas, timing = run_tasks(tasks, max_workers=2)
+
+    assert metas["report"]["deps"] == ["clean", "pca", "regress"]
+    t = timing["tasks"]
+    assert t["pca"]["start_sec"] < t["regress"]["end_sec"] and t["regress"]["start_sec"] < t["pca"]["end_sec"]
+    assert t["report"]["start_sec"] >= max(t["pca"]["end_sec"], t["regress"]["end_sec"])
+    assert timing["wall_sec"] < 0.55
+    assert timing["overlap_sec"] > 0.1
+
+
+def test_run_tasks_critical_path_follows_slowest_branch():
+    tasks = [
+        Task("a", _sleep(0.01, "a")),
+        Task("slow", _sleep(0.2, "slow"), deps=("a",)),
+        Task("fast", _sleep(0.01, "fast"), deps=("a",)),
+        Task("end", _sleep(0.01, "end"), deps=("slow", "fast")),
+    ]
+    _, timing = run_tasks(tasks, max_workers=2)
+    assert timing["critical_path"] == ["a", "slow", "end"]
+    assert timing["critical_path_sec"] >= 0.2
+
+
+def test_run_tasks_propagates_exception_and_skips_dependents():
+    ran = []
+
+    def boom(done):
+        raise RuntimeError("pca failed")
+
+    def after(done):
+        ran.append("report")
+        return {}
+
+    tasks = [Task("pca", boom), Task("regress", _sleep(0.05, "regress")), Task("report", after, deps=("pca",))]
+    with pytest.raises(RuntimeError, match="pca failed"):
+        run_tasks(tasks, max_workers=2)
+    assert ran == []
+
+
+def test_run_tasks_detects_cycles_and_unknown_deps():
+    with pytest.raises(ValueError, match="cycle"):
+        run_tasks([Task("a", _sleep(0, "a"), deps=("b",)), Task("b", _sleep(0, "b"), deps=("a",))])
+    with pytest.raises(ValueError, match="unknown"):
+        run_tasks([Task("a", _sleep(0, "a"), deps=("missing",))])
+
+
+def test_run_tasks_in_process_task_runs_in_child_process():
+    metas, _ = run_tasks([Task("child", _child_pid, in_process=True)])
+    assert metas["child"]["pid"] != os.getpid()
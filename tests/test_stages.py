@@ -0,0 +1,70 @@
+import random
+import time
+
+import pytest
+
+from app.pipeline.stages import Stage, run_stages
+
+
+def _jitter(x):
+    time.sleep(random.random() * 0.002)
+    return x, None
+
+
+def _collect(payloads, stages):
+    got = []
+    meta = run_stages(payloads, stages, lambda idx, payload, err: got.append((idx, payload, err)))
+    return got, meta
+
+
+def test_run_stages_every_item_reaches_sink_with_its_idx():
+    stages = [
+        Stage("read", _jitter, workers=4, queue_depth=4),
+        Stage("double", lambda x: (x * 2, None), workers=2, queue_depth=2),
+    ]
+    got, meta = _collect(range(50), stages)
+
+    # items may finish out of order; idx identifies the input
+    assert sorted(got) == [(i, i * 2, None) for i in range(50)]
+    assert set(meta["stages"]) == {"read", "double", "sink"}
+    assert meta["stages"]["read"]["n_items"] == 50
+
+
+def test_run_stages_errors_pass_through_later_stages():
+    seen = []
+
+    def fail_on_3(x):
+        if x == 3:
+            return None, "no_face_detected"
+        if x == 5:
+            raise RuntimeError("boom")
+        return x, None
+
+    def record(x):
+        seen.append(x)
+        return x, None
+
+    got, _ = _collect(range(8), [Stage("a", fail_on_3, workers=2), Stage("b", record)])
+    by_idx = {i: (p, e) for i, p, e in got}
+
+    assert by_idx[3] == (None, "no_face_detected")
+    assert by_idx[5] == (None, "exception:RuntimeError")
+    assert 3 not in seen and 5 not in seen and None not in seen
+    assert len(got) == 8
+
+
+def test_run_stages_completes_with_queue_depth_one():
+    stages = [Stage(f"s{i}", _jitter, workers=3, queue_depth=1) for i in range(3)]
+    got, _ = _collect(range(30), stages)
+    assert sorted(i for i, _, _ in got) == list(range(30))
+
+
+def test_run_stages_empty_input():
+    got, meta = _collect([], [Stage("a", _jitter, workers=2)])
+    assert got == [] and meta["stages"]["sink"]["n_items"] == 0
+
+
+@pytest.mark.parametrize("workers, depth", [(0, 4), (1, 0)])
+def test_run_stages_rejects_invalid_config(workers, depth):
+    with pytest.raises(ValueError):
+        run_stages(range(3), [Stage("a", _jitter, workers=workers, queue_depth=depth)], lambda *a: None)